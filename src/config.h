@@ -23,6 +23,7 @@ struct Config {
     std::string area_mapping_processed_file_prefix;
     bool download_srtm = false;
     bool download_gmted = false;
+    std::uint16_t download_threads;
 
     auto cmd(int argc, char **argv) {
 
@@ -43,6 +44,7 @@ struct Config {
                 ("skip_elevation,e", "skip elevation data merge")
                 ("srtm", "fetch SRTM tiles and exit")
                 ("gmted", "fetch GMTED tiles and exit")
+                ("download_threads", po::value<std::uint16_t>(&download_threads)->default_value(8), "number of parallel tile downloads")
                 ("interpolate,i", "interpolate intermediate nodes")
                 ("remove_tag,T", po::value<std::string>(&remove_tag_regex_str)->default_value("(.*:)?source(:.*)?|(.*:)?note(:.*)?|url|created_by|fixme|wikipedia"), "regex to match removable tags")
                 ("geo_tiff_folders,F", po::value<std::vector<std::string>>(&geo_tiff_folders)->multitoken()->default_value(std::vector<std::string>{"tiffs", "srtmdata", "gmteddata"}, "tiffs, srtmdata, gmteddata"), "paths to geotiff folders")
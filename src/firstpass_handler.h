@@ -3,6 +3,7 @@
 
 #include <ostream>
 #include <set>
+#include <string_view>
 
 #include <boost/regex.hpp>
 
@@ -18,10 +19,12 @@
 class FirstPassHandler : public osmium::handler::Handler {
     friend std::ostream &operator<<(std::ostream &out, const FirstPassHandler &handler);
 private:
-    const std::set<std::string> kInvalidatingTags{"building", "landuse",
+    // transparent comparator so lookups with tag keys (const char*) don't
+    // construct a temporary std::string per tag
+    const std::set<std::string, std::less<>> kInvalidatingTags{"building", "landuse",
         "boundary", "natural", "place", "waterway", "aeroway",
         "aviation", "military", "power", "communication", "man_made"};
-    const std::set<std::string> kNoElevationsKeys{"bridge", "tunnel", "cutting", "indoor" };
+    const std::set<std::string, std::less<>> kNoElevationsKeys{"bridge", "tunnel", "cutting", "indoor" };
     boost::regex &remove_tags_;
 
     unsigned long long node_count_ = 0;
@@ -29,8 +32,8 @@ private:
     unsigned long long way_count_ = 0;
 
     static bool tag_validates(const osmium::Tag &tag) {
-        const std::string key = tag.key();
-        const std::string value = tag.value();
+        const std::string_view key = tag.key();
+        const std::string_view value = tag.value();
 
         if (key == "highway") return true;
         if (key == "route") return true;
@@ -63,7 +66,7 @@ private:
     bool is_no_elevation(const osmium::Way &way) {
         for (const auto &tag : way.tags()) {
             if (kNoElevationsKeys.contains(tag.key())){
-                const std::string value = tag.value();
+                const std::string_view value = tag.value();
                 if (value != "no") {
                     return true;
                 }
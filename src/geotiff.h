@@ -3,11 +3,19 @@
 
 #include <gdal_priv.h>
 #include <iostream>
+#include <mutex>
 #include <osmium/util/file.hpp>
 #include <osmium/util/progress_bar.hpp>
 
 static constexpr double kNoDataValue = -32768.0;
 
+// several services register the GDAL drivers in their constructors; run the
+// registration only once per process no matter how often it is requested
+inline void registerGDALDriversOnce() {
+    static std::once_flag flag;
+    std::call_once(flag, GDALAllRegister);
+}
+
 static const OGRSpatialReference getWGS84Reference() {
     OGRSpatialReference reference;
     reference.SetWellKnownGeogCS("WGS84");
@@ -6,6 +6,8 @@
 #include <gdal_priv.h>
 #include <iostream>
 
+#include "geotiff.h"
+
 namespace fs = std::filesystem;
 
 const std::string LocationAreaService::delim_str_ = ";";
@@ -232,7 +234,6 @@ std::vector<std::string> LocationAreaService::get_area(osmium::Location l) {
         return areas;
     }
     grid_id_t grid_index = ((int) l.lat() + 90) * 360 + ((int) l.lon() + 180);
-    OGRPoint point(l.lon(), l.lat());
     if (debug_mode_) {
         std::cout << "Lookup point: (" << l.lon() << " " << l.lat() << ") grid index " << grid_index << " => " << mapping_index_[grid_index] << std::endl;
     }
@@ -242,7 +243,10 @@ std::vector<std::string> LocationAreaService::get_area(osmium::Location l) {
         default:// single area
             areas.push_back(mapping_id_[mapping_index_[grid_index]]);
             break;
-        case area_id_multiple_:// multiple areas
+        case area_id_multiple_: {// multiple areas
+            // only the exact containment checks need a point geometry, so it
+            // is not built for the empty and single-area grid cells
+            OGRPoint point(l.lon(), l.lat());
             auto range = mapping_area_.equal_range(grid_index);
             for (auto i = range.first; i != range.second; ++i) {
                 if (i->second.geo->Contains(&point)) {
@@ -250,6 +254,7 @@ std::vector<std::string> LocationAreaService::get_area(osmium::Location l) {
                 }
             }
             break;
+        }
     }
     if (debug_mode_) {
         std::cout << "Result: ";
@@ -262,7 +267,7 @@ std::vector<std::string> LocationAreaService::get_area(osmium::Location l) {
 }
 
 LocationAreaService::LocationAreaService(bool debug_mode, std::uint16_t id_col, std::uint16_t geo_col, std::string &geo_type, bool file_has_header, std::string &processed_file_prefix) : debug_mode_(debug_mode), id_col_(id_col), geo_col_(geo_col), geo_type_(geo_type), file_has_header_(file_has_header), processed_file_prefix_(processed_file_prefix) {
-    GDALAllRegister();
+    registerGDALDriversOnce();
     for (std::uint16_t grid_lat = 0; grid_lat < 180; grid_lat++) {
         for (std::uint16_t grid_lon = 0; grid_lon < 360; grid_lon++) {
             grid_id_t grid_index = grid_lat * 360 + grid_lon;
@@ -108,38 +108,36 @@ void LocationElevationService::load(const std::vector<std::string> &paths) {
 }
 
 std::shared_ptr<Geotiff> LocationElevationService::load_tiff(const char * filename) {
+    // called once per node, so the hit path does a single map lookup and the
+    // file size is only determined (and cached) when a tile is actually opened
     const auto search = cache_.find(filename);
-    ulong filesize = 0;
-    if (tile_size_.count(filename)) {
-        filesize = tile_size_[filename];
-    } else {
-        filesize = std::filesystem::file_size(filename);
-        tile_size_.insert(std::make_pair(filename, filesize));
-    }
-
     if (search != cache_.end()) {
-        const auto geoTiff = cache_.at(filename);
         lru_.remove(filename);
         lru_.emplace_front(filename);
-        return geoTiff;
+        return search->second;
     }
 
     if (!std::filesystem::exists(filename)) {
         return nullptr;
     }
+    auto size_entry = tile_size_.find(filename);
+    if (size_entry == tile_size_.end()) {
+        size_entry = tile_size_.insert(std::make_pair(filename, std::filesystem::file_size(filename))).first;
+    }
+    const auto filesize = size_entry->second;
     auto geotiff = std::make_shared<Geotiff>(filename, debug_mode_);
     if (geotiff == nullptr) {
         return nullptr;
     }
 
-    while (mem_size_ > 0 && mem_size_ + tile_size_[filename] > cache_limit_) {
+    while (mem_size_ > 0 && mem_size_ + filesize > cache_limit_) {
         auto to_remove = lru_.back();
         mem_size_ -= tile_size_[to_remove];
         cache_.erase(to_remove);
         lru_.pop_back();
     }
     cache_.insert(make_pair(filename, geotiff));
-    mem_size_ += tile_size_[filename];
+    mem_size_ += filesize;
     lru_.emplace_front(filename);
 
     if (debug_mode_) {
@@ -173,5 +171,5 @@ double LocationElevationService::elevation(osmium::Location l, bool count) {
 }
 
 LocationElevationService::LocationElevationService(ulong cache_limit, bool debug_mode) : cache_limit_(cache_limit), debug_mode_(debug_mode) {
-    GDALAllRegister();
+    registerGDALDriversOnce();
 }
@@ -2,10 +2,15 @@
 #include "firstpass_handler.h"
 #include "rewrite_handler.h"
 
+#include <atomic>
 #include <chrono>
 #include <filesystem>
 #include <iostream>
+#include <mutex>
 #include <string>
+#include <thread>
+#include <unordered_map>
+#include <vector>
 
 #include <boost/regex.hpp>
 
@@ -17,8 +22,7 @@
 #include <osmium/visitor.hpp>
 #include <curl/curl.h>
 #include <curl/easy.h>
-#include "minizip/unzip.h"
-#include "minizip/ioapi.h"
+#include "zip_stream_extractor.h"
 
 using namespace std;
 
@@ -35,21 +39,82 @@ auto show_memory_used() {
     }
 }
 
-void download_tiles(const string type) {
-    string outdir = type + "data";
-    if (mkdir(outdir.c_str(), S_IRWXU | S_IRWXG | S_IROTH | S_IXOTH) == -1) {
-        if (errno == EEXIST) {
-            // alredy exists
-        } else {
-            // something else
-            std::cout << "cannot create tile data folder! Error:" << strerror(errno) << std::endl;
-            return;
+struct TileDownload {
+    string type;// tile source, "srtm" or "gmted"
+    string fname;
+    string url;
+    string outfile;
+    time_t local_time = 0;// mtime of the already present file, 0 if absent
+};
+
+enum class DownloadResult { kLoaded, kUnchanged, kFailed };
+
+// large stdio buffer so tile data hits the disk in few big writes instead of
+// one syscall per received network chunk
+static constexpr size_t kFileBufferSize = 1 << 20;
+
+static constexpr int kDownloadAttempts = 3;
+
+// transient network failures and server-side errors are worth retrying,
+// client-side errors like 404 are not
+inline bool is_transient_error(const CURLcode res, const long http_status) {
+    if (res == CURLE_OK || res == CURLE_HTTP_RETURNED_ERROR) {
+        return http_status == 429 || http_status >= 500;
+    }
+    switch (res) {
+        case CURLE_COULDNT_RESOLVE_HOST:
+        case CURLE_COULDNT_CONNECT:
+        case CURLE_OPERATION_TIMEDOUT:
+        case CURLE_SEND_ERROR:
+        case CURLE_RECV_ERROR:
+        case CURLE_GOT_NOTHING:
+        case CURLE_PARTIAL_FILE:
+            return true;
+        default:
+            return false;
+    }
+}
+
+static mutex download_output_mutex;
+
+size_t zip_stream_write(char *ptr, size_t size, size_t nmemb, void *userdata) {
+    auto *extractor = static_cast<ZipStreamExtractor *>(userdata);
+    return extractor->write(ptr, size * nmemb) ? size * nmemb : 0;
+}
+
+// opens the target only when body bytes actually arrive, so a 304 response
+// does not truncate the file that is already there
+struct LazyFileTarget {
+    string path;
+    FILE *fp = nullptr;
+};
+
+size_t lazy_file_write(char *ptr, size_t size, size_t nmemb, void *userdata) {
+    auto *target = static_cast<LazyFileTarget *>(userdata);
+    if (target->fp == nullptr) {
+        target->fp = fopen(target->path.c_str(), "wb");
+        if (target->fp == nullptr) {
+            return 0;
+        }
+        setvbuf(target->fp, nullptr, _IOFBF, kFileBufferSize);
+    }
+    return fwrite(ptr, size, nmemb, target->fp);
+}
+
+// reads tiles_<type>.csv and builds the complete download table - source url,
+// target path and local file state - once up front, so the workers only
+// consume precomputed entries
+vector<TileDownload> read_tile_list(const string &type, const string &outdir) {
+    // one scan of the tile folder instead of a stat call per csv entry
+    unordered_map<string, time_t> present_files;
+    if (filesystem::is_directory(outdir)) {
+        for (const auto &entry : filesystem::directory_iterator(outdir)) {
+            if (!entry.is_regular_file()) { continue; }
+            present_files.emplace(entry.path().filename().string(),
+                chrono::system_clock::to_time_t(chrono::file_clock::to_sys(entry.last_write_time())));
         }
     }
-    curl_global_init(CURL_GLOBAL_ALL);
-    auto request = 0;
-    auto present = 0;
-    auto loaded = 0;
+    vector<TileDownload> tiles;
     ifstream csv("tiles_"+type+".csv");
     while(!csv.eof()) {
         string fname = "";
@@ -60,70 +125,173 @@ void download_tiles(const string type) {
             cout << "Invalid download instruction! " << type << ": " << fname << " - " << url << endl;
             continue;
         }
-        request++;
         string outfile = outdir + "/" + fname;
-        if (filesystem::exists(outfile)) {
-            present++;
-            continue;
+        time_t local_time = 0;
+        const auto present = present_files.find(fname);
+        if (present != present_files.end()) {
+            // present tiles are not skipped outright but rechecked with a
+            // conditional request, so updated upstream data is picked up;
+            // unchanged files only cost one small round trip (304)
+            local_time = present->second;
         }
-        CURL *curl;
+        tiles.push_back(TileDownload{type, fname, url, outfile, local_time});
+    }
+    return tiles;
+}
+
+DownloadResult download_tile(CURL *curl, const TileDownload &tile) {
+    const string &outfile = tile.outfile;
+    // the body goes to a temporary name and is only renamed over the real
+    // tile once complete, so a failed recheck of an already present tile
+    // never destroys the copy a previous run downloaded
+    const string tmpfile = outfile + ".part";
+    {
+        lock_guard<mutex> lock(download_output_mutex);
+        cout << "Download: " << tile.url << endl;
+    }
+    curl_easy_setopt(curl, CURLOPT_URL, tile.url.c_str());
+    curl_easy_setopt(curl, CURLOPT_NOSIGNAL, 1L);
+    curl_easy_setopt(curl, CURLOPT_FILETIME, 1L);
+    if (tile.local_time > 0) {
+        curl_easy_setopt(curl, CURLOPT_TIMECONDITION, CURL_TIMECOND_IFMODSINCE);
+        curl_easy_setopt(curl, CURLOPT_TIMEVALUE, static_cast<long>(tile.local_time));
+    } else {
+        curl_easy_setopt(curl, CURLOPT_TIMECONDITION, CURL_TIMECOND_NONE);
+    }
+    for (auto attempt = 1;; attempt++) {
         CURLcode res;
-        curl = curl_easy_init();
-        if (curl) {
-            cout << "Download: " << url << endl;
-            auto fp = fopen((outfile + (type == "srtm" ? ".zip" : "")).c_str(),"wb");
-            curl_easy_setopt(curl, CURLOPT_URL, url.c_str());
-            curl_easy_setopt(curl, CURLOPT_WRITEDATA, fp);
+        bool unpack_ok = true;
+        if (tile.type == "srtm") {
+            // unpack the tile while the archive streams in instead of staging
+            // the full zip on disk and extracting it in a second pass
+            ZipStreamExtractor extractor(tile.fname, tmpfile);
+            curl_easy_setopt(curl, CURLOPT_WRITEFUNCTION, zip_stream_write);
+            curl_easy_setopt(curl, CURLOPT_WRITEDATA, &extractor);
             res = curl_easy_perform(curl);
-            /* always cleanup */
-            curl_easy_cleanup(curl);
-            fclose(fp);
-            if (res > 0) {
-                cout << "ERROR " << res << " downloading from url " << url << endl;
-                continue;
+            unpack_ok = extractor.success();
+        } else {
+            LazyFileTarget target{tmpfile};
+            curl_easy_setopt(curl, CURLOPT_WRITEFUNCTION, lazy_file_write);
+            curl_easy_setopt(curl, CURLOPT_WRITEDATA, &target);
+            res = curl_easy_perform(curl);
+            if (target.fp != nullptr) {
+                fclose(target.fp);
             }
         }
-        if (type == "srtm") {
-            cout << "Unpack: " << outfile << endl;
-            unzFile uf = NULL;
-            uf = unzOpen64((outfile + ".zip").c_str());
-            if (uf==NULL) {
-                printf("Cannot open %s.zip\n", outfile.c_str());
-                unzClose(uf);
-                continue;
+        long http_status = 0;
+        curl_easy_getinfo(curl, CURLINFO_RESPONSE_CODE, &http_status);
+        if (res == CURLE_OK) {
+            long condition_unmet = 0;
+            curl_easy_getinfo(curl, CURLINFO_CONDITION_UNMET, &condition_unmet);
+            if (condition_unmet == 1) {
+                return DownloadResult::kUnchanged;
             }
-            if (unzLocateFile(uf,fname.c_str(),true)!=UNZ_OK) {
-                printf("file %s not found in the zipfile\n", fname.c_str());
-                unzClose(uf);
-                continue;
+            if (http_status < 400) {
+                if (!unpack_ok) {// a broken archive won't get better on retry
+                    std::error_code ec;
+                    filesystem::remove(tmpfile, ec);
+                    lock_guard<mutex> lock(download_output_mutex);
+                    cout << "ERROR unpacking " << tile.fname << " from " << tile.url << endl;
+                    return DownloadResult::kFailed;
+                }
+                std::error_code ec;
+                filesystem::rename(tmpfile, outfile, ec);
+                if (ec) {
+                    lock_guard<mutex> lock(download_output_mutex);
+                    cout << "ERROR moving " << tmpfile << " into place: " << ec.message() << endl;
+                    return DownloadResult::kFailed;
+                }
+                // align the file time with the server so the next run can send
+                // a meaningful conditional request
+                long remote_time = -1;
+                curl_easy_getinfo(curl, CURLINFO_FILETIME, &remote_time);
+                if (remote_time > 0) {
+                    filesystem::last_write_time(outfile, chrono::file_clock::from_sys(chrono::system_clock::from_time_t(remote_time)), ec);
+                }
+                return DownloadResult::kLoaded;
             }
-            if (unzOpenCurrentFile(uf)!=UNZ_OK) {
-                printf("Error within zipfile!\n");
-                unzClose(uf);
-                continue;
+        }
+        {// don't leave an error page or partial body behind
+            std::error_code ec;
+            filesystem::remove(tmpfile, ec);
+        }
+        if (attempt >= kDownloadAttempts || !is_transient_error(res, http_status)) {
+            lock_guard<mutex> lock(download_output_mutex);
+            cout << "ERROR " << res << " (HTTP " << http_status << ") downloading from url " << tile.url << endl;
+            return DownloadResult::kFailed;
+        }
+        {
+            lock_guard<mutex> lock(download_output_mutex);
+            cout << "Retrying (" << attempt + 1 << "/" << kDownloadAttempts << "): " << tile.url << endl;
+        }
+        // exponential backoff: 1s, 2s, ... before the next attempt
+        this_thread::sleep_for(chrono::seconds(1L << (attempt - 1)));
+    }
+}
+
+void download_tiles(const vector<string> &types, const unsigned download_threads) {
+    static once_flag curl_global_once;
+    call_once(curl_global_once, curl_global_init, CURL_GLOBAL_ALL);
+    // one combined work list across all requested sources: the shared pool
+    // late-binds each idle connection to whichever source still has tiles
+    // left, instead of draining the sources strictly one after the other
+    vector<TileDownload> tiles;
+    for (const auto &type : types) {
+        string outdir = type + "data";
+        std::error_code ec;
+        filesystem::create_directory(outdir, ec);// no-op when it already exists
+        if (ec) {
+            std::cout << "cannot create tile data folder! Error: " << ec.message() << std::endl;
+            continue;
+        }
+        auto source_tiles = read_tile_list(type, outdir);
+        tiles.insert(tiles.end(), make_move_iterator(source_tiles.begin()), make_move_iterator(source_tiles.end()));
+    }
+
+    // the downloads are network-latency-bound, not CPU-bound, so the pool size
+    // is a configured bound on in-flight requests rather than a core count -
+    // large enough to hide latency, small enough not to hammer the tile servers
+    const auto worker_count = std::min(tiles.size(), static_cast<size_t>(std::max(1u, static_cast<unsigned>(download_threads))));
+    atomic<size_t> next_tile{0};
+    atomic<int> loaded{0};
+    atomic<int> present{0};
+    vector<thread> workers;
+    workers.reserve(worker_count);
+    for (size_t w = 0; w < worker_count; w++) {
+        workers.emplace_back([&]() {
+            // one handle per worker: libcurl keeps the connection to the tile
+            // server alive on the handle, saving the TCP/TLS handshake for
+            // every download after the first
+            CURL *curl = curl_easy_init();
+            if (!curl) {
+                return;
             }
-            ofstream ofile(outfile);
-            if (ofile.is_open()) {
-                int err;
-                int size_buf = 16384;
-                char* buf = (char*)malloc(size_buf);
-                do {
-                    err = unzReadCurrentFile(uf,buf,size_buf);
-                    if (err < 0) {
-                        printf("error %d with zipfile in unzReadCurrentFile\n",err);
+            // prefer HTTP/2 over TLS so transfers multiplex on one connection
+            // where the server supports it; curl falls back to HTTP/1.1 otherwise
+            curl_easy_setopt(curl, CURLOPT_HTTP_VERSION, CURL_HTTP_VERSION_2TLS);
+            // hand larger chunks to the write callbacks (default is 16 KB)
+            curl_easy_setopt(curl, CURLOPT_BUFFERSIZE, 512L * 1024L);
+            // keep error pages for 4xx/5xx responses out of the tile files
+            curl_easy_setopt(curl, CURLOPT_FAILONERROR, 1L);
+            for (size_t i = next_tile++; i < tiles.size(); i = next_tile++) {
+                switch (download_tile(curl, tiles[i])) {
+                    case DownloadResult::kLoaded:
+                        loaded++;
+                        break;
+                    case DownloadResult::kUnchanged:
+                        present++;
                         break;
-                    }
-                    ofile.write(buf, size_buf);
-                } while (err > 0);
-                ofile.close();
+                    case DownloadResult::kFailed:
+                        break;
+                }
             }
-            unzCloseCurrentFile(uf);
-            unzClose(uf);
-            filesystem::remove(outfile + ".zip");
-        }
-        loaded++;
+            curl_easy_cleanup(curl);
+        });
     }
-    cout << "Requested " << request << " tiles. " << present << " files already present, " << loaded << " downloaded." << endl;
+    for (auto &worker : workers) {
+        worker.join();
+    }
+    cout << "Requested " << tiles.size() << " tiles. " << present << " files already present, " << loaded << " downloaded." << endl;
 }
 
 void first_pass(Config &config, boost::regex &remove_tag_regex, osmium::nwr_array<osmium::index::IdSetDense<osmium::unsigned_object_id_type>> &valid_ids, osmium::nwr_array<osmium::index::IdSetSmall<osmium::unsigned_object_id_type>> &no_elevation);
@@ -133,14 +301,16 @@ int main(int argc, char **argv) {
     Config config;
     config.cmd(argc, argv);
     try {
-        if (config.download_srtm) {
-            cout << "Downloading SRTM tiles. This might take a while..." << endl;
-            download_tiles("srtm");
-            return 0;
-        }
-        if (config.download_gmted) {
-            cout << "Downloading GMTED tiles. This might take a while..." << endl;
-            download_tiles("gmted");
+        if (config.download_srtm || config.download_gmted) {
+            vector<string> types;
+            if (config.download_srtm) {
+                types.emplace_back("srtm");
+            }
+            if (config.download_gmted) {
+                types.emplace_back("gmted");
+            }
+            cout << "Downloading " << (config.download_srtm ? "SRTM" : "") << (config.download_srtm && config.download_gmted ? " and " : "") << (config.download_gmted ? "GMTED" : "") << " tiles. This might take a while..." << endl;
+            download_tiles(types, config.download_threads);
             return 0;
         }
 
@@ -0,0 +1,273 @@
+#ifndef OSM_TRANSFORM_ZIP_STREAM_EXTRACTOR_H
+#define OSM_TRANSFORM_ZIP_STREAM_EXTRACTOR_H
+
+#include <algorithm>
+#include <cstdint>
+#include <cstdio>
+#include <string>
+#include <vector>
+
+#include <zlib.h>
+
+// Streaming extractor for one member of a ZIP archive. Bytes are fed in as
+// they arrive from the network; local file headers are parsed on the fly and
+// the target member is inflated straight into its output file, so neither the
+// archive nor the member is ever buffered completely in memory or staged on
+// disk. The extracted bytes are checked against the member's CRC-32, so
+// success() guarantees an intact file.
+class ZipStreamExtractor {
+    enum class State { kLocalHeader, kFileName, kMemberData, kDataDescriptor, kCentralDirectory };
+
+    static constexpr uint32_t kLocalHeaderSignature = 0x04034b50;
+    static constexpr uint32_t kCentralDirectorySignature = 0x02014b50;
+    static constexpr uint32_t kDataDescriptorSignature = 0x08074b50;
+    static constexpr uint16_t kFlagHasDataDescriptor = 0x0008;
+    static constexpr uint16_t kMethodStored = 0;
+    static constexpr uint16_t kMethodDeflated = 8;
+
+    static uint16_t le16(const unsigned char *b) { return static_cast<uint16_t>(b[0] | (b[1] << 8)); }
+    static uint32_t le32(const unsigned char *b) {
+        return static_cast<uint32_t>(b[0]) | (static_cast<uint32_t>(b[1]) << 8) |
+               (static_cast<uint32_t>(b[2]) << 16) | (static_cast<uint32_t>(b[3]) << 24);
+    }
+
+    std::string target_name_;
+    std::string outfile_;
+
+    State state_ = State::kLocalHeader;
+    std::vector<unsigned char> pending_;// partially received header bytes
+    size_t need_ = 30;                  // size of the structure being collected
+
+    uint16_t flags_ = 0;
+    uint16_t method_ = 0;
+    size_t name_len_ = 0;
+    uint64_t data_remaining_ = 0;
+    bool extract_current_ = false;
+    uint32_t header_crc_ = 0;
+    uint32_t data_crc_ = 0;             // running crc of the extracted bytes
+    bool verify_descriptor_crc_ = false;// expected crc is still in transit
+
+    z_stream zstream_ = {};
+    bool zstream_active_ = false;
+    std::vector<unsigned char> inflate_buf_;
+    FILE *out_ = nullptr;
+
+    bool found_ = false;
+    bool complete_ = false;
+    bool failed_ = false;
+
+    bool fail() {
+        failed_ = true;
+        return false;
+    }
+
+    // moves bytes from the input into pending_; true once need_ bytes are there
+    bool fill_pending(const unsigned char *&p, size_t &remaining) {
+        const size_t take = std::min(remaining, need_ - pending_.size());
+        pending_.insert(pending_.end(), p, p + take);
+        p += take;
+        remaining -= take;
+        return pending_.size() == need_;
+    }
+
+    bool end_member() {
+        if (zstream_active_) {
+            inflateEnd(&zstream_);
+            zstream_active_ = false;
+        }
+        if (out_ != nullptr) {
+            fclose(out_);
+            out_ = nullptr;
+            if (flags_ & kFlagHasDataDescriptor) {
+                // completion is decided once the descriptor crc arrives
+                verify_descriptor_crc_ = true;
+            } else if (data_crc_ == header_crc_) {
+                complete_ = true;
+            } else {// corrupted in transit despite a well-formed stream
+                std::remove(outfile_.c_str());
+                return fail();
+            }
+        }
+        extract_current_ = false;
+        pending_.clear();
+        if (flags_ & kFlagHasDataDescriptor) {
+            state_ = State::kDataDescriptor;
+            need_ = 4;
+        } else {
+            state_ = State::kLocalHeader;
+            need_ = 30;
+        }
+        return true;
+    }
+
+    bool parse_local_header() {
+        const auto signature = le32(&pending_[0]);
+        if (signature == kCentralDirectorySignature) {
+            state_ = State::kCentralDirectory;
+            return true;
+        }
+        if (signature != kLocalHeaderSignature) { return fail(); }
+        flags_ = le16(&pending_[6]);
+        method_ = le16(&pending_[8]);
+        header_crc_ = le32(&pending_[14]);
+        data_remaining_ = le32(&pending_[18]);
+        name_len_ = le16(&pending_[26]);
+        need_ = name_len_ + le16(&pending_[28]);
+        pending_.clear();
+        state_ = State::kFileName;
+        return true;
+    }
+
+    bool start_member_data() {
+        const std::string name(pending_.begin(), pending_.begin() + static_cast<long>(name_len_));
+        extract_current_ = name == target_name_;
+        if (method_ != kMethodStored && method_ != kMethodDeflated) {
+            // cannot even skip an unknown method if its size is in the trailing
+            // data descriptor instead of the header
+            if (extract_current_ || (flags_ & kFlagHasDataDescriptor)) { return fail(); }
+        }
+        if (!(flags_ & kFlagHasDataDescriptor) && data_remaining_ == 0xFFFFFFFFull) {
+            return fail();// zip64 sizes are not expected from the tile servers
+        }
+        // a stored member with its (nonzero) size only in the trailing data
+        // descriptor cannot be delimited while streaming; it is treated as
+        // empty here, which makes the next header parse fail loudly instead
+        // of corrupting output
+        if (extract_current_) {
+            found_ = true;
+            data_crc_ = crc32(0L, Z_NULL, 0);
+            out_ = fopen(outfile_.c_str(), "wb");
+            if (out_ == nullptr) { return fail(); }
+            // collect the inflated output into few big writes
+            setvbuf(out_, nullptr, _IOFBF, 1 << 20);
+        }
+        // skipped members with sizes in the header don't need decompression
+        if (method_ == kMethodDeflated && (extract_current_ || (flags_ & kFlagHasDataDescriptor))) {
+            zstream_ = {};
+            if (inflateInit2(&zstream_, -MAX_WBITS) != Z_OK) { return fail(); }
+            zstream_active_ = true;
+        }
+        pending_.clear();
+        state_ = State::kMemberData;
+        return true;
+    }
+
+    bool consume_member_data(const unsigned char *&p, size_t &remaining) {
+        if (!zstream_active_) {// raw copy or skip, size known from the header
+            const auto take = static_cast<size_t>(std::min<uint64_t>(remaining, data_remaining_));
+            if (out_ != nullptr && take > 0) {
+                if (fwrite(p, 1, take, out_) != take) { return fail(); }
+                data_crc_ = crc32(data_crc_, p, static_cast<uInt>(take));
+            }
+            p += take;
+            remaining -= take;
+            data_remaining_ -= take;
+            if (data_remaining_ == 0) { return end_member(); }
+            return true;
+        }
+        auto chunk = remaining;
+        if (!(flags_ & kFlagHasDataDescriptor)) {
+            chunk = static_cast<size_t>(std::min<uint64_t>(remaining, data_remaining_));
+        }
+        zstream_.next_in = const_cast<unsigned char *>(p);
+        zstream_.avail_in = static_cast<uInt>(chunk);
+        int ret = Z_OK;
+        do {
+            zstream_.next_out = inflate_buf_.data();
+            zstream_.avail_out = static_cast<uInt>(inflate_buf_.size());
+            ret = inflate(&zstream_, Z_NO_FLUSH);
+            if (ret == Z_BUF_ERROR && zstream_.avail_in == 0) {
+                // no progress was possible because the received chunk is fully
+                // consumed (it happens to end exactly on a full output buffer);
+                // not an error, the next chunk continues the stream
+                ret = Z_OK;
+                break;
+            }
+            if (ret != Z_OK && ret != Z_STREAM_END) { return fail(); }
+            const size_t produced = inflate_buf_.size() - zstream_.avail_out;
+            if (out_ != nullptr && produced > 0) {
+                if (fwrite(inflate_buf_.data(), 1, produced, out_) != produced) { return fail(); }
+                data_crc_ = crc32(data_crc_, inflate_buf_.data(), static_cast<uInt>(produced));
+            }
+        } while (ret == Z_OK && (zstream_.avail_in > 0 || zstream_.avail_out == 0));
+        const size_t consumed = chunk - zstream_.avail_in;
+        p += consumed;
+        remaining -= consumed;
+        if (!(flags_ & kFlagHasDataDescriptor)) {
+            data_remaining_ -= consumed;
+            if (data_remaining_ == 0 && ret != Z_STREAM_END) { return fail(); }
+        }
+        if (ret == Z_STREAM_END) { return end_member(); }
+        return true;
+    }
+
+    // 12 bytes of crc/sizes, optionally preceded by a 4 byte signature
+    bool consume_data_descriptor() {
+        if (need_ == 4) {
+            need_ = le32(&pending_[0]) == kDataDescriptorSignature ? 16 : 12;
+            return true;// signature resolved, keep collecting the remainder
+        }
+        if (verify_descriptor_crc_) {// descriptor of the extracted member
+            verify_descriptor_crc_ = false;
+            if (le32(&pending_[need_ - 12]) == data_crc_) {
+                complete_ = true;
+            } else {// corrupted in transit despite a well-formed stream
+                std::remove(outfile_.c_str());
+                return fail();
+            }
+        }
+        pending_.clear();
+        state_ = State::kLocalHeader;
+        need_ = 30;
+        return true;
+    }
+
+public:
+    ZipStreamExtractor(std::string target_name, std::string outfile)
+        : target_name_(std::move(target_name)), outfile_(std::move(outfile)), inflate_buf_(65536) {}
+
+    ~ZipStreamExtractor() {
+        if (zstream_active_) { inflateEnd(&zstream_); }
+        if (out_ != nullptr) {// transfer ended mid-member, remove the partial file
+            fclose(out_);
+            std::remove(outfile_.c_str());
+        }
+    }
+
+    ZipStreamExtractor(const ZipStreamExtractor &) = delete;
+    ZipStreamExtractor &operator=(const ZipStreamExtractor &) = delete;
+
+    // consumes a chunk of the archive; false aborts the transfer
+    bool write(const char *data, size_t len) {
+        if (failed_) { return false; }
+        auto p = reinterpret_cast<const unsigned char *>(data);
+        size_t remaining = len;
+        while (remaining > 0) {
+            switch (state_) {
+                case State::kLocalHeader:
+                    if (!fill_pending(p, remaining)) { return true; }
+                    if (!parse_local_header()) { return false; }
+                    break;
+                case State::kFileName:
+                    if (!fill_pending(p, remaining)) { return true; }
+                    if (!start_member_data()) { return false; }
+                    break;
+                case State::kMemberData:
+                    if (!consume_member_data(p, remaining)) { return false; }
+                    break;
+                case State::kDataDescriptor:
+                    if (!fill_pending(p, remaining)) { return true; }
+                    if (!consume_data_descriptor()) { return false; }
+                    break;
+                case State::kCentralDirectory:
+                    // only directory entries and bookkeeping follow, ignore them
+                    return true;
+            }
+        }
+        return true;
+    }
+
+    bool success() const { return found_ && complete_ && !failed_; }
+};
+
+#endif//OSM_TRANSFORM_ZIP_STREAM_EXTRACTOR_H
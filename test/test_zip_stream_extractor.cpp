@@ -0,0 +1,231 @@
+#include <boost/test/unit_test.hpp>
+
+#include <filesystem>
+#include <fstream>
+#include <random>
+#include <sstream>
+
+#include <zlib.h>
+
+#include "zip_stream_extractor.h"
+
+namespace {
+
+    void append_le16(std::string &out, const uint16_t v) {
+        out.push_back(static_cast<char>(v & 0xff));
+        out.push_back(static_cast<char>((v >> 8) & 0xff));
+    }
+
+    void append_le32(std::string &out, const uint32_t v) {
+        append_le16(out, static_cast<uint16_t>(v & 0xffff));
+        append_le16(out, static_cast<uint16_t>(v >> 16));
+    }
+
+    // raw deflate; an optional full flush splits the stream into two
+    // byte-aligned blocks, pinning a decompression boundary to that offset
+    std::string deflate_raw(const std::string &data, const size_t full_flush_at = 0, const int level = Z_BEST_COMPRESSION) {
+        z_stream zs = {};
+        BOOST_REQUIRE_EQUAL(deflateInit2(&zs, level, Z_DEFLATED, -MAX_WBITS, 8, Z_DEFAULT_STRATEGY), Z_OK);
+        std::string out;
+        std::vector<unsigned char> buf(1 << 16);
+        const auto pump = [&](const char *p, const size_t n, const int flush) {
+            zs.next_in = reinterpret_cast<unsigned char *>(const_cast<char *>(p));
+            zs.avail_in = static_cast<uInt>(n);
+            do {
+                zs.next_out = buf.data();
+                zs.avail_out = static_cast<uInt>(buf.size());
+                deflate(&zs, flush);
+                out.append(reinterpret_cast<char *>(buf.data()), buf.size() - zs.avail_out);
+            } while (zs.avail_out == 0);
+        };
+        if (full_flush_at > 0) {
+            pump(data.data(), full_flush_at, Z_FULL_FLUSH);
+            pump(data.data() + full_flush_at, data.size() - full_flush_at, Z_FINISH);
+        } else {
+            pump(data.data(), data.size(), Z_FINISH);
+        }
+        deflateEnd(&zs);
+        return out;
+    }
+
+    std::string zip_member(const std::string &name, const std::string &payload, const uint16_t method,
+                           const bool data_descriptor, const size_t full_flush_at = 0,
+                           const int level = Z_BEST_COMPRESSION) {
+        const std::string comp = method == 8 ? deflate_raw(payload, full_flush_at, level) : payload;
+        const auto crc = static_cast<uint32_t>(crc32(0L, reinterpret_cast<const Bytef *>(payload.data()), static_cast<uInt>(payload.size())));
+        std::string out;
+        append_le32(out, 0x04034b50);
+        append_le16(out, 20);                               // version needed
+        append_le16(out, data_descriptor ? 0x0008 : 0);     // general purpose flags
+        append_le16(out, method);
+        append_le32(out, 0);                                // dos time/date
+        append_le32(out, data_descriptor ? 0 : crc);
+        append_le32(out, data_descriptor ? 0 : static_cast<uint32_t>(comp.size()));
+        append_le32(out, data_descriptor ? 0 : static_cast<uint32_t>(payload.size()));
+        append_le16(out, static_cast<uint16_t>(name.size()));
+        append_le16(out, 0);                                // extra field length
+        out += name;
+        out += comp;
+        if (data_descriptor) {
+            append_le32(out, 0x08074b50);
+            append_le32(out, crc);
+            append_le32(out, static_cast<uint32_t>(comp.size()));
+            append_le32(out, static_cast<uint32_t>(payload.size()));
+        }
+        return out;
+    }
+
+    // the extractor only checks the first central directory signature and
+    // ignores everything after it, so a stub entry is enough
+    std::string central_directory_stub() {
+        std::string out;
+        append_le32(out, 0x02014b50);
+        out.append(42, '\0');
+        return out;
+    }
+
+    std::string make_payload(const size_t random_len, const size_t run_len) {
+        std::minstd_rand rng(42);
+        std::string payload;
+        payload.reserve(random_len + run_len);
+        for (size_t i = 0; i < random_len; i++) {
+            payload.push_back(static_cast<char>(rng() & 0xff));
+        }
+        payload.append(run_len, 'A');
+        return payload;
+    }
+
+    std::string read_file(const std::string &path) {
+        std::ifstream in(path, std::ios::binary);
+        std::ostringstream ss;
+        ss << in.rdbuf();
+        return ss.str();
+    }
+
+    std::string temp_outfile() {
+        return (std::filesystem::temp_directory_path() / "osmt_test_zip_member.tif").string();
+    }
+
+    bool feed(ZipStreamExtractor &extractor, const std::string &bytes, const size_t chunk_size) {
+        for (size_t pos = 0; pos < bytes.size(); pos += chunk_size) {
+            if (!extractor.write(bytes.data() + pos, std::min(chunk_size, bytes.size() - pos))) {
+                return false;
+            }
+        }
+        return true;
+    }
+
+    void check_extract(const std::string &archive, const std::string &member, const std::string &payload, const size_t chunk_size) {
+        const auto outfile = temp_outfile();
+        std::filesystem::remove(outfile);
+        ZipStreamExtractor extractor(member, outfile);
+        BOOST_CHECK(feed(extractor, archive, chunk_size));
+        BOOST_CHECK(extractor.success());
+        BOOST_CHECK(read_file(outfile) == payload);
+        std::filesystem::remove(outfile);
+    }
+
+}// namespace
+
+BOOST_AUTO_TEST_SUITE( test_zip_stream_extractor )
+
+BOOST_AUTO_TEST_CASE( test_deflated_member ) {
+    const auto payload = make_payload(20000, 40000);
+    const auto archive = zip_member("readme.txt", "see website", 8, false) +
+                         zip_member("srtm_01_02.tif", payload, 8, false) +
+                         zip_member("trailer.txt", "bye", 8, false) +
+                         central_directory_stub();
+    for (const size_t chunk_size: {size_t(1), size_t(7), size_t(1024), size_t(65536), archive.size()}) {
+        check_extract(archive, "srtm_01_02.tif", payload, chunk_size);
+    }
+}
+
+BOOST_AUTO_TEST_CASE( test_stored_member ) {
+    const auto payload = make_payload(5000, 0);
+    const auto archive = zip_member("readme.txt", "see website", 0, false) +
+                         zip_member("srtm_01_02.tif", payload, 0, false) +
+                         central_directory_stub();
+    for (const size_t chunk_size: {size_t(1), size_t(997), archive.size()}) {
+        check_extract(archive, "srtm_01_02.tif", payload, chunk_size);
+    }
+}
+
+BOOST_AUTO_TEST_CASE( test_data_descriptor_member ) {
+    const auto payload = make_payload(10000, 30000);
+    const auto archive = zip_member("readme.txt", "see website", 8, true) +
+                         zip_member("srtm_01_02.tif", payload, 8, true) +
+                         zip_member("trailer.txt", "bye", 8, true) +
+                         central_directory_stub();
+    for (const size_t chunk_size: {size_t(1), size_t(4096), archive.size()}) {
+        check_extract(archive, "srtm_01_02.tif", payload, chunk_size);
+    }
+}
+
+// splits the archive at every position into two writes, covering all the
+// states a network chunk boundary can interrupt; the full flush placed at
+// exactly one inflate output buffer (64 KiB) reproduces the case where a
+// chunk is consumed completely while also filling the output buffer, which
+// zlib answers with a benign Z_BUF_ERROR on the next call
+BOOST_AUTO_TEST_CASE( test_chunk_split_sweep ) {
+    const auto payload = make_payload(1000, 80000);
+    const auto archive = zip_member("readme.txt", "see website", 8, false) +
+                         zip_member("srtm_01_02.tif", payload, 8, false, 65536) +
+                         central_directory_stub();
+    const auto outfile = temp_outfile();
+    for (size_t split = 1; split < archive.size(); split++) {
+        std::filesystem::remove(outfile);
+        ZipStreamExtractor extractor("srtm_01_02.tif", outfile);
+        const bool ok = extractor.write(archive.data(), split) &&
+                        extractor.write(archive.data() + split, archive.size() - split);
+        BOOST_REQUIRE_MESSAGE(ok && extractor.success(), "extraction failed at split " << split);
+        BOOST_REQUIRE_MESSAGE(read_file(outfile) == payload, "output mismatch at split " << split);
+    }
+    std::filesystem::remove(outfile);
+}
+
+// a flipped payload byte leaves the archive structurally intact (deflate at
+// level 0 uses stored blocks, so no inflate error either) - only the crc
+// check can tell the corrupt tile from a good one
+BOOST_AUTO_TEST_CASE( test_corrupted_member ) {
+    const auto payload = make_payload(8000, 8000);
+    for (const auto &[method, data_descriptor]: {std::pair<uint16_t, bool>{0, false}, {8, false}, {8, true}}) {
+        auto archive = zip_member("srtm_01_02.tif", payload, method, data_descriptor, 0, 0) +
+                       central_directory_stub();
+        // past the 30 byte header, the name and (for deflate) the 5 byte
+        // stored-block header, well inside the member's data
+        archive[1000] ^= 0x01;
+        const auto outfile = temp_outfile();
+        std::filesystem::remove(outfile);
+        ZipStreamExtractor extractor("srtm_01_02.tif", outfile);
+        feed(extractor, archive, 1024);
+        BOOST_CHECK(!extractor.success());
+        BOOST_CHECK(!std::filesystem::exists(outfile));
+    }
+}
+
+BOOST_AUTO_TEST_CASE( test_missing_member ) {
+    const auto archive = zip_member("readme.txt", "see website", 8, false) +
+                         central_directory_stub();
+    const auto outfile = temp_outfile();
+    std::filesystem::remove(outfile);
+    ZipStreamExtractor extractor("srtm_01_02.tif", outfile);
+    BOOST_CHECK(feed(extractor, archive, 1024));
+    BOOST_CHECK(!extractor.success());
+    BOOST_CHECK(!std::filesystem::exists(outfile));
+}
+
+BOOST_AUTO_TEST_CASE( test_truncated_archive ) {
+    const auto payload = make_payload(10000, 10000);
+    const auto archive = zip_member("srtm_01_02.tif", payload, 8, false);
+    const auto outfile = temp_outfile();
+    std::filesystem::remove(outfile);
+    {
+        ZipStreamExtractor extractor("srtm_01_02.tif", outfile);
+        BOOST_CHECK(feed(extractor, archive.substr(0, archive.size() / 2), 1024));
+        BOOST_CHECK(!extractor.success());
+    }
+    // a transfer that broke off mid-member must not leave a partial file
+    BOOST_CHECK(!std::filesystem::exists(outfile));
+}
+
+BOOST_AUTO_TEST_SUITE_END()